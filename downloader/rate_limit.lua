@@ -17,8 +17,9 @@ if next(config) ~= nil then
     end
 end
 
--- 当前时间
-local now = redis.call('TIME')[1]
+-- 当前时间（秒，带微秒精度，保证等待时间计算精确）
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
 local current_tokens = tonumber(redis.call('GET', tokens_key))
 local exists = redis.call('EXISTS', tokens_key)
 if exists == 0 then
@@ -37,12 +38,13 @@ else
     end
 end
 
--- 尝试扣除令牌
+-- 检查并扣除令牌，一次原子调用完成；失败时直接返回需要等待的毫秒数
 if current_tokens >= requested then
-    redis.call('DECRBY', tokens_key, requested)
-    return {1}
+    -- 令牌数可能是小数，不能用 DECRBY
+    redis.call('SET', tokens_key, current_tokens - requested)
+    return {1, 0}
 else
     local deficit = requested - current_tokens
-    local wait_time = deficit / rate
-    return {0, tostring(now + wait_time)}
-end
\ No newline at end of file
+    local wait_ms = math.ceil(deficit / rate * 1000)
+    return {0, wait_ms}
+end
@@ -1,56 +1,80 @@
-import time
 import random
+import pathlib
+import threading
+import weakref
 from functools import wraps
 import redis  # 使用同步 redis 客户端，或替换为 redis.asyncio 版本
 from typing import Callable, List
 
+# Lua 脚本在模块导入时读取一次，所有限流器实例共享
+_LUA_TEXT = pathlib.Path(__file__).with_name("rate_limit.lua").read_text()
+
 
 class TokenBucketLimiter:
+    # redis_client -> script sha，同一个客户端只 SCRIPT LOAD 一次；
+    # 弱引用键随客户端回收自动清除，不会无限增长，也不会被复用 id 的新客户端误用
+    _script_shas = weakref.WeakKeyDictionary()
+
     def __init__(self, redis_client_provider: Callable[[], redis.Redis]):
         self.redis_client_provider = redis_client_provider
-        self._redis = None
-        self._script_sha = None
-        self._lua_script = self._load_lua_script()
+        self._redis = redis_client_provider()
+        self._script_sha = self._load_script()
+        # close() 后所有处于等待中的调用立即返回，避免线程卡在 sleep 里
+        self._stop_evt = threading.Event()
 
-    def _load_lua_script(self) -> str:
-        # 假设你将 Lua 脚本放在当前目录下，文件名为 rate_limit.lua
-        with open("rate_limit.lua", "r") as f:
-            return f.read()
+    def _load_script(self, force: bool = False) -> str:
+        sha = None if force else self._script_shas.get(self._redis)
+        if sha is None:
+            sha = self._redis.script_load(_LUA_TEXT)
+            self._script_shas[self._redis] = sha
+        return sha
 
     @property
     def redis(self):
-        if self._redis is None:
-            self._redis = self.redis_client_provider()
-            self._script_sha = self._redis.script_load(self._lua_script)
         return self._redis
 
+    def close(self):
+        self._stop_evt.set()
+
+    def _evalsha(self, keys: List[str], *argv):
+        try:
+            return self._redis.evalsha(self._script_sha, len(keys), *keys, *argv)
+        except redis.exceptions.NoScriptError:
+            # Redis 重启或 SCRIPT FLUSH 后脚本缓存丢失，重新加载后重试一次
+            self._script_sha = self._load_script(force=True)
+            return self._redis.evalsha(self._script_sha, len(keys), *keys, *argv)
+
     def token_bucket(self, token_type: str, rate: float, capacity: int, param_keys: List[str] = None):
+        # 参数在装饰时转成字符串，Lua 侧用 tonumber 解析
+        argv = (str(rate), str(capacity))
+
+        def make_keys(base_key):
+            return [
+                f"{base_key}:tokens",
+                f"{base_key}:timestamp",
+                f"{base_key}:config"
+            ]
+
         def decorator(func):
+            prefix = f"limiter:{func.__name__}:{token_type}:"
+            # 无维度限流时 key 固定不变，提前算好
+            static_keys = None if param_keys else make_keys(prefix)
+
             @wraps(func)
             def wrapper(*args, **kwargs):
-                # 可扩展支持维度限流：根据传入参数拼接 key
-                dim = "_".join([str(kwargs.get(k, '')) for k in (param_keys or [])])
-                base_key = f"limiter:{func.__name__}:{token_type}:{dim}"
-
-                keys = [
-                    f"{base_key}:tokens",
-                    f"{base_key}:timestamp",
-                    f"{base_key}:config"
-                ]
+                keys = static_keys
+                if keys is None:
+                    # 可扩展支持维度限流：根据传入参数拼接 key
+                    dim = "_".join([str(kwargs.get(k, '')) for k in param_keys])
+                    keys = make_keys(prefix + dim)
 
                 while True:
-                    result = self.redis.evalsha(
-                        self._script_sha,
-                        len(keys),
-                        *keys,
-                        rate,
-                        capacity
-                    )
-                    if result[0] == 1:
+                    allowed, wait_ms = self._evalsha(keys, *argv)
+                    if allowed == 1:
                         return func(*args, **kwargs)
-                    else:
-                        # 添加抖动，防止多个任务同时重试雪崩
-                        wait = max(float(result[1]) - time.time(), 0) + random.uniform(0.01, 0.1)
-                        time.sleep(wait)
+                    # 服务端已算出补足令牌所需时间，本地加抖动，防止多个任务同时重试雪崩
+                    wait = int(wait_ms) / 1000 + random.uniform(0.01, 0.1)
+                    if self._stop_evt.wait(wait):
+                        raise RuntimeError("rate limiter closed")
             return wrapper
         return decorator
@@ -15,6 +15,11 @@ def main():
 
     # 仅允许访问 --root 目录下的文件，避免路径穿越
     class Handler(http.server.SimpleHTTPRequestHandler):
+        # 支持 keep-alive，Pod 回源可复用连接
+        protocol_version = "HTTP/1.1"
+        # ThreadingTCPServer 每个连接一个线程：Pod 连接池里空闲的 keep-alive 连接不能永远占着线程
+        timeout = 30
+
         def translate_path(self, path):
             path = unquote(path)
             if path.startswith("/"):
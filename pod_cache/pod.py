@@ -9,20 +9,28 @@
 import argparse
 import hashlib
 import atexit
+import datetime
+import email.utils
 import functools
 import http.server
+import multiprocessing
 import os
-import re
+import random
+import select
+import shutil
 import signal
 import socket
 import socketserver
+import string
 import sys
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import unquote, urlparse
-from urllib.request import urlopen
 
-import redis  # pip install redis
+import urllib3  # pip install urllib3
+
+from redis_conn import connect_redis
 
 PODS_ZSET = "pods:active"  # ZSET：所有活跃 pod 节点，score=最近心跳时间戳
 POD_HASH_TMPL = "pod:{id}"   # HASH：pod 的详细信息，如 host/port/cache_dir/origin
@@ -30,7 +38,142 @@ BUSY_SET_TMPL = "pod:{id}:busy"   # SET：并发连接占位（此处暂未使
 
 HEARTBEAT_SEC = 5   # 心跳刷新间隔，秒
 
-SAFE_PATH = re.compile(r"^[A-Za-z0-9._/\-]+$")   # 限制文件名字符，防止目录穿越
+HEALTHZ_BODY = b'{"ok": true}'
+
+# 允许出现在文件路径里的字符；bytes.translate 删掉这些字符后若还有剩余即为非法（C 层单次扫描，无需正则）
+SAFE_PATH_CHARS = (string.ascii_letters + string.digits + "._/-").encode("ascii")
+
+# 进程级 HTTP 连接池：回源复用 keep-alive 连接，避免每次未命中都重新握手
+_HTTP = urllib3.PoolManager(num_pools=4, maxsize=16, retries=False)
+
+COPY_CHUNK = 1024 * 1024   # 回源拷贝的单次搬运量
+
+# 预热授权结果的本地缓存：(pod_id, file_key) -> (allowed, expires_at)
+# 授权结果在预热 TTL 内基本不变，重复未命中时不必每次 SISMEMBER；
+# 未授权结果缓存得更短，Worker 改写预热集合后能尽快生效
+PREHEAT_ALLOW_TTL_SEC = 30
+PREHEAT_DENY_TTL_SEC = 5
+PREHEAT_CACHE_MAX = 8192
+_preheat_cache = {}
+_preheat_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=4096)
+def _file_md5(rel: str) -> str:
+    """rel -> 预热集合使用的文件 key；映射不变，热门文件不必每次重新哈希"""
+    return hashlib.md5(rel.encode("utf-8"), usedforsecurity=False).hexdigest()
+
+
+def _parse_range(header, size):
+    """
+    解析单段 Range 头（"bytes=a-b" / "bytes=a-" / "bytes=-n"）。
+    返回 (start, end)；无 Range、多段或格式无法识别返回 None（按整文件响应）；不可满足返回 False（416）。
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if last and end < start:
+                return None
+            if start >= size:
+                return False
+        else:
+            suffix = int(last)
+            if suffix <= 0 or size == 0:
+                return False
+            start, end = max(size - suffix, 0), size - 1
+    except ValueError:
+        return None
+    return start, min(end, size - 1)
+
+
+def _preheat_allowed(r, pod_id, file_key) -> bool:
+    key = (pod_id, file_key)
+    now = time.monotonic()
+    with _preheat_lock:
+        hit = _preheat_cache.get(key)
+    if hit is not None and hit[1] > now:
+        return hit[0]
+
+    allowed = bool(r.sismember(f"preheat:{file_key}", pod_id))
+    ttl = PREHEAT_ALLOW_TTL_SEC if allowed else PREHEAT_DENY_TTL_SEC
+    with _preheat_lock:
+        if len(_preheat_cache) >= PREHEAT_CACHE_MAX:
+            for k in [k for k, (_, exp) in _preheat_cache.items() if exp <= now]:
+                del _preheat_cache[k]
+            if len(_preheat_cache) >= PREHEAT_CACHE_MAX:
+                _preheat_cache.clear()
+        _preheat_cache[key] = (allowed, now + ttl)
+    return allowed
+
+
+def _splice_to_file(resp, out) -> bool:
+    """
+    Linux 上用 splice(2) 把回源响应体从 socket 经管道直接搬进缓存文件，数据不进入用户态。
+    （sendfile(2) 不接受 socket 作为输入端，所以必须借道管道。）
+    只处理明文 http 上定长、未压缩的响应；不满足条件返回 False，由调用方走普通拷贝。
+    成功后响应已被绕过 http.client 读完，连接直接关闭，不再放回连接池复用。
+    """
+    if not hasattr(os, "splice"):
+        return False
+    # 以下依赖 urllib3 / http.client 的内部属性；任何一个缺失都说明实现变了，
+    # 在读取任何 body 之前放弃，交给 copyfileobj，而不是让回源变成 502
+    try:
+        raw = resp._fp   # 底层 http.client.HTTPResponse
+        conn = resp.connection
+        sock = conn.sock if conn is not None else None
+        if (raw is None or sock is None or raw.chunked or not raw.length
+                or "Content-Encoding" in resp.headers):
+            return False
+        # 只有明文 TCP socket 上的字节才是 body 本身；https 回源的 SSLSocket（或其他包装）
+        # 上搬的是密文，必须交给 copyfileobj 经 TLS 层解密
+        if type(sock) is not socket.socket:
+            return False
+        remaining = raw.length
+        buffered = raw.fp
+        peek, read = buffered.peek, buffered.read
+    except AttributeError:
+        return False
+
+    # 解析响应头时 http.client 可能已预读了一部分 body，先把这部分写掉
+    head = peek()[:remaining]
+    read(len(head))
+    out.write(head)
+    out.flush()
+    remaining -= len(head)
+
+    timeout = sock.gettimeout()
+    poller = select.poll()
+    poller.register(sock.fileno(), select.POLLIN)
+    out_fd = out.fileno()
+    pipe_r, pipe_w = os.pipe()
+    try:
+        while remaining:
+            try:
+                n = os.splice(sock.fileno(), pipe_w, min(remaining, COPY_CHUNK), flags=os.SPLICE_F_MOVE)
+            except BlockingIOError:
+                # 设置了超时的 socket 是非阻塞的，等数据到达再继续
+                if not poller.poll(None if timeout is None else timeout * 1000):
+                    raise TimeoutError("origin read timed out")
+                continue
+            if n == 0:
+                raise IOError(f"origin closed connection with {remaining} bytes left")
+            remaining -= n
+            while n:
+                n -= os.splice(pipe_r, out_fd, n, flags=os.SPLICE_F_MOVE)
+    finally:
+        os.close(pipe_r)
+        os.close(pipe_w)
+        resp.close()
+    return True
 
 class CacheRequestHandler(http.server.SimpleHTTPRequestHandler):
     """
@@ -38,21 +181,50 @@ class CacheRequestHandler(http.server.SimpleHTTPRequestHandler):
     我们覆盖 do_GET 和 do_HEAD，实现缓存逻辑和健康探针。
     """
 
-    def __init__(self, *args, cache_dir=None, origin=None, redis_cli=None, pod_id=None, **kwargs):
-        self.cache_dir = cache_dir  # 本地缓存目录
-        self.origin = origin.rstrip("/")# 源站 base URL
-        self.redis = redis_cli
-        self.pod_id = pod_id
-        # 父类会根据 self.path 去 self.directory 下找文件
-        super().__init__(*args, directory=cache_dir, **kwargs)
+    # HTTP/1.1 才能保持 keep-alive，每个响应都必须带 Content-Length
+    protocol_version = "HTTP/1.1"
+    # 等待下一个请求行时的空闲超时（秒）：线程池很小，空闲 keep-alive 连接不能长期占坑
+    idle_timeout = 1
+    # 读到请求行之后（读请求头、发送响应）的 socket 超时：只用来清理彻底失联的对端，
+    # 客户端读得慢或暂停读取不应中断 sendfile 传输
+    timeout = 300
+
+    # 运行参数由 bind() 生成的子类以类属性提供：每个连接实例化 handler 时
+    # 不必经 functools.partial 解包 kwargs、逐个赋实例属性
+    cache_dir = None   # 本地缓存目录（绝对路径）
+    directory = None   # 父类约定的根目录，与 cache_dir 相同
+    origin = None      # 源站 base URL
+    redis = None
+    pod_id = None
+
+    @classmethod
+    def bind(cls, cache_dir, origin, redis_cli, pod_id):
+        """生成绑定了运行参数的 handler 子类，交给 TCPServer 使用"""
+        return type(cls.__name__, (cls,), {
+            "cache_dir": cache_dir,
+            "directory": cache_dir,
+            "origin": origin.rstrip("/"),
+            "redis": redis_cli,
+            "pod_id": pod_id,
+        })
+
+    def __init__(self, *args, **kwargs):
+        # 跳过 SimpleHTTPRequestHandler.__init__ 里对 directory 的 os.getcwd()/fspath 处理，目录已是类属性
+        http.server.BaseHTTPRequestHandler.__init__(self, *args, **kwargs)
+
+    def handle_one_request(self):
+        # 短超时只覆盖等待请求行这一段，parse_request 里再换回 self.timeout
+        self.connection.settimeout(self.idle_timeout)
+        super().handle_one_request()
+
+    def parse_request(self):
+        self.connection.settimeout(self.timeout)
+        return super().parse_request()
 
     def log_message(self, format, *args):
         # 打印日志，加上 [pod] 前缀方便区分
         sys.stderr.write("[pod] " + (format % args) + "\n")
 
-    def _file_md5(self, rel: str) -> bool:
-        return hashlib.md5(rel.encode("utf-8")).hexdigest()
-    
     def _ensure_cached(self, rel: str) -> bool:
         """
         确保 cache_dir/<rel> 存在；如不存在则从 origin 下沉。
@@ -64,18 +236,20 @@ class CacheRequestHandler(http.server.SimpleHTTPRequestHandler):
         if os.path.exists(local_path):
             return True
         # 固定 K 副本预热：非授权 Pod 避免回源
-        file_key = self._file_md5(rel)
-        preheat_set = f"preheat:{file_key}"
+        file_key = _file_md5(rel)
         try:
             if self.redis is not None and self.pod_id is not None:
-                allowed = self.redis.sismember(preheat_set, self.pod_id)
-                if not allowed:
+                if not _preheat_allowed(self.redis, self.pod_id, file_key):
                     # 返回 425 Too Early（自定义信号），提示 Worker 切换到授权 Pod
+                    body = b'{"error":"preheat required"}'
                     self.send_response(425, "Preheat Required")
                     self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
                     self.send_header("X-Preheat-Needed", "1")
+                    # 客户端会转去其他 Pod，不保留这条连接，免得空闲连接占着工作线程
+                    self.send_header("Connection", "close")
                     self.end_headers()
-                    self.wfile.write(b'{"error":"preheat required"}')
+                    self.wfile.write(body)
                     return False
         except Exception as e:
             # Redis 不可用时退化为直接回源，保证可用性
@@ -85,12 +259,22 @@ class CacheRequestHandler(http.server.SimpleHTTPRequestHandler):
         self.log_message("fetching from origin: %s", origin_url)
         try:
             # 从 origin 拉取文件，流式写入
-            with urlopen(origin_url, timeout=30) as resp, open(local_path, "wb") as out:
-                while True:
-                    chunk = resp.read(1024 * 1024)
-                    if not chunk:
-                        break
-                    out.write(chunk)
+            resp = _HTTP.request("GET", origin_url, preload_content=False, timeout=30)
+            try:
+                if resp.status != 200:
+                    # 错误响应的 body 很小，读完即可复用连接
+                    resp.drain_conn()
+                    raise IOError(f"HTTP Error {resp.status}: {resp.reason}")
+                try:
+                    with open(local_path, "wb") as out:
+                        if not _splice_to_file(resp, out):
+                            shutil.copyfileobj(resp, out, COPY_CHUNK)
+                except Exception:
+                    # 中途失败（写盘出错、读超时等）：直接断开连接，不再把剩余 body 读完
+                    resp.close()
+                    raise
+            finally:
+                resp.release_conn()
             self.log_message("cached %s from origin", rel)
             return True
         except Exception as e:
@@ -104,6 +288,13 @@ class CacheRequestHandler(http.server.SimpleHTTPRequestHandler):
                 pass
             return False
 
+    def _is_safe_rel(self, rel: str) -> bool:
+        """限制文件名字符，并确认规范化后的路径仍落在 cache_dir 内，防止目录穿越"""
+        if not rel.isascii() or rel.encode("ascii").translate(None, SAFE_PATH_CHARS):
+            return False
+        target = os.path.normpath(os.path.join(self.cache_dir, rel))
+        return target.startswith(self.cache_dir + os.sep)
+
     def _parse_rel(self):
         """
         从原始 path 中解析出 /files/<rel> 的 rel。
@@ -121,19 +312,90 @@ class CacheRequestHandler(http.server.SimpleHTTPRequestHandler):
         rel = unquote(rel).lstrip("/")
         self.log_message("rel parsed: %r", rel)
 
-        if not rel or not SAFE_PATH.match(rel):
+        if not rel or not self._is_safe_rel(rel):
             self.send_error(400, f"bad path: {rel!r}")
             return True, None
 
         return True, rel
 
-    # 让 HEAD /healthz 返回 200；/files/<rel> 也要走缓存与路径重写
+    def _not_modified(self, mtime) -> bool:
+        """照搬 SimpleHTTPRequestHandler.send_head 的 If-Modified-Since 判断"""
+        if "If-Modified-Since" not in self.headers or "If-None-Match" in self.headers:
+            return False
+        try:
+            ims = email.utils.parsedate_to_datetime(self.headers["If-Modified-Since"])
+        except (TypeError, IndexError, OverflowError, ValueError):
+            return False
+        if ims.tzinfo is None:
+            # 不带时区的旧日期格式按 UTC 处理（RFC 9110 5.6.7）
+            ims = ims.replace(tzinfo=datetime.timezone.utc)
+        if ims.tzinfo is not datetime.timezone.utc:
+            return False
+        last_modif = datetime.datetime.fromtimestamp(mtime, datetime.timezone.utc).replace(microsecond=0)
+        return last_modif <= ims
+
+    def _send_cached_file(self, rel: str, head_only: bool = False):
+        """
+        绕过父类的 copyfileobj，用 sendfile(2) 把缓存文件直接写进 socket，文件 -> socket 全程在内核完成。
+        支持单段 Range 请求（断点续传），多段或无法识别的 Range 按整文件返回；
+        If-Range 与 Last-Modified 不一致时忽略 Range，返回整文件 200，避免续传拼接出新旧混杂的文件。
+        If-Modified-Since 的 304 判断与父类 send_head 一致。
+        """
+        local_path = os.path.join(self.cache_dir, rel)
+        try:
+            f = open(local_path, "rb")
+        except OSError:
+            self.send_error(404, "File not found")
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            size = st.st_size
+            last_modified = self.date_time_string(st.st_mtime)
+            if self._not_modified(st.st_mtime):
+                self.send_response(304)
+                self.end_headers()
+                return
+
+            rng = None
+            if_range = self.headers.get("If-Range")
+            # 没有 ETag，只有与 Last-Modified 完全相同的日期才算匹配
+            if if_range is None or if_range.strip() == last_modified:
+                rng = _parse_range(self.headers.get("Range"), size)
+            if rng is False:
+                self.send_response(416, "Range Not Satisfiable")
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                return
+
+            if rng is None:
+                start, end = 0, size - 1
+                self.send_response(200)
+            else:
+                start, end = rng
+                self.send_response(206, "Partial Content")
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            count = end - start + 1
+            self.send_header("Content-Type", self.guess_type(local_path))
+            self.send_header("Content-Length", str(count))
+            self.send_header("Last-Modified", last_modified)
+            self.send_header("Accept-Ranges", "bytes")
+            self.end_headers()
+            if head_only or count <= 0:
+                return
+            self.wfile.flush()
+            # socket.sendfile 内部走 os.sendfile，并处理了带超时 socket 的等待
+            self.connection.sendfile(f, start, count)
+
+    # 让 HEAD /healthz 返回 200；/files/<rel> 也走缓存逻辑
     def do_HEAD(self):
         parsed = urlparse(self.path)
         if parsed.path == "/healthz":
             # 健康检查：直接返回 200
             self.send_response(200)
             self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(HEALTHZ_BODY)))
             self.end_headers()
             return
 
@@ -146,20 +408,18 @@ class CacheRequestHandler(http.server.SimpleHTTPRequestHandler):
             if not self._ensure_cached(rel):
                 return  # 已 502
 
-            # 核心修复：重写路径为 "/<rel>"，让父类在 cache_dir 下找
-            self.path = "/" + rel
-            return http.server.SimpleHTTPRequestHandler.do_HEAD(self)
+            return self._send_cached_file(rel, head_only=True)
 
-        # 其他路径交给父类（通常会 404）
-        return http.server.SimpleHTTPRequestHandler.do_HEAD(self)
+        self.send_error(404, "Not Found")
 
     def do_GET(self):
         parsed = urlparse(self.path)
         if parsed.path == "/healthz":
             self.send_response(200)
             self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(HEALTHZ_BODY)))
             self.end_headers()
-            self.wfile.write(b'{"ok": true}')
+            self.wfile.write(HEALTHZ_BODY)
             return
 
         is_files, rel = self._parse_rel()
@@ -171,13 +431,73 @@ class CacheRequestHandler(http.server.SimpleHTTPRequestHandler):
             if not self._ensure_cached(rel):
                 return  # 已 502
 
-            # 核心修复：重写路径为 "/<rel>"，让父类在 cache_dir 下找
-            self.path = "/" + rel
-            return http.server.SimpleHTTPRequestHandler.do_GET(self)
+            return self._send_cached_file(rel)
 
         self.send_error(404, "Not Found")
 
+class CacheHTTPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """
+    reuse_port=True 时开启 SO_REUSEPORT：多个进程各自 bind 同一端口，由内核在进程间分发连接，
+    绕开单进程 GIL，让缓存服务用满多核。只在 --procs > 1 时开启，
+    否则误启动的第二个同端口 Pod 会静默地分走连接，而不是 bind 失败。
+    请求交给固定大小的线程池处理：线程全忙时 accept 循环阻塞，新连接堆积在内核 backlog，
+    满了直接被拒绝，而不是无限制地开线程把内存撑爆。
+    线程池的线程不是 daemon 线程：关闭时不再接新请求、取消尚未开始的任务，
+    已在处理中的回源和传输会做完，进程随后才退出。
+    """
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler, max_workers, reuse_port=False):
+        self.reuse_port = reuse_port
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pod-http")
+        self._slots = threading.BoundedSemaphore(max_workers)
+        super().__init__(server_address, handler)
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        self._pool.submit(self._process_and_release, request, client_address)
+
+    def _process_and_release(self, request, client_address):
+        try:
+            self.process_request_thread(request, client_address)
+        finally:
+            self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        # 不在这里阻塞；解释器退出时会 join 池线程，把进行中的请求排空
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+def serve_forever(port, handler, max_workers):
+    """子进程入口：只负责处理 HTTP 请求，注册/心跳由主进程负责"""
+    with CacheHTTPServer(("0.0.0.0", port), handler, max_workers, reuse_port=True) as httpd:
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+@functools.cache
 def get_ip():
+    """
+    本机对外通告的 IP，进程内只解析一次。
+    优先级：POD_ADVERTISE_IP 环境变量 > 主机名解析出的非回环地址 > UDP connect 探测 > 127.0.0.1
+    （容器里 8.8.8.8 可能被防火墙挡住，建议直接用环境变量指定）
+    """
+    ip = os.environ.get("POD_ADVERTISE_IP")
+    if ip:
+        return ip
+    try:
+        for *_, sockaddr in socket.getaddrinfo(socket.gethostname(), None, socket.AF_INET):
+            if not sockaddr[0].startswith("127."):
+                return sockaddr[0]
+    except OSError:
+        pass
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     try:
         s.connect(("8.8.8.8", 80))
@@ -197,21 +517,40 @@ def register_redis(r, pod_id, info):
 
 def heartbeat_loop(r, pod_id, info, stop_evt):
     """后台线程：定时刷新心跳到 Redis"""
+    pod_key = POD_HASH_TMPL.format(id=pod_id)
+    # 按固定节拍对齐 monotonic 截止时间，Redis 写入耗时不会累积成漂移；
+    # 首拍随机错开，避免同时启动的大批 Pod 齐刷刷地写心跳
+    deadline = time.monotonic() + random.uniform(0, HEARTBEAT_SEC)
+    if stop_evt.wait(max(0, deadline - time.monotonic())):
+        return
     while not stop_evt.is_set():
+        deadline += HEARTBEAT_SEC
         try:
-            info["last_seen"] = str(time.time())
-            r.hset(POD_HASH_TMPL.format(id=pod_id), mapping=info)
-            r.zadd(PODS_ZSET, {pod_id: time.time()})
+            now = time.time()
+            info["last_seen"] = str(now)
+            # 每拍都写完整 info（只多几十字节）：若曾被 Worker 当作僵尸节点清理，
+            # HASH 与 ZSET member 在同一事务里完整恢复，Worker 不会读到只有 last_seen 的残缺 HASH
+            pipe = r.pipeline(transaction=True)
+            pipe.hset(pod_key, mapping=info)
+            pipe.zadd(PODS_ZSET, {pod_id: now})
+            pipe.execute()
         except Exception as e:
             print(f"[pod] heartbeat error: {e}", file=sys.stderr)
-        stop_evt.wait(HEARTBEAT_SEC)
+        now = time.monotonic()
+        if now > deadline:
+            # Redis 卡顿超过一个周期：跳过错过的节拍，不补发
+            deadline += HEARTBEAT_SEC * ((now - deadline) // HEARTBEAT_SEC + 1)
+        if stop_evt.wait(deadline - now):
+            break
 
 def unregister(r, pod_id):
     """Pod 下线时清理 Redis 状态"""
     try:
-        r.zrem(PODS_ZSET, pod_id)
-        r.delete(BUSY_SET_TMPL.format(id=pod_id))
-        r.delete(POD_HASH_TMPL.format(id=pod_id))
+        pipe = r.pipeline(transaction=True)
+        pipe.zrem(PODS_ZSET, pod_id)
+        pipe.delete(BUSY_SET_TMPL.format(id=pod_id))
+        pipe.delete(POD_HASH_TMPL.format(id=pod_id))
+        pipe.execute()
         print(f"[pod] unregistered {pod_id}")
     except Exception as e:
         print(f"[pod] unregister error: {e}", file=sys.stderr)
@@ -223,10 +562,17 @@ def main():
     parser.add_argument("--origin", type=str, required=True)
     parser.add_argument("--redis-url", type=str, default="redis://127.0.0.1:6379/0")
     parser.add_argument("--max-conns", type=int, default=2)
+    parser.add_argument("--procs", type=int, default=1, help="监听同一端口的服务进程数（SO_REUSEPORT）")
     args = parser.parse_args()
+    if args.procs > 1 and ("fork" not in multiprocessing.get_all_start_methods()
+                           or not hasattr(socket, "SO_REUSEPORT")):
+        parser.error("--procs > 1 需要支持 fork 与 SO_REUSEPORT 的平台（如 Linux）")
 
     os.makedirs(args.cache_dir, exist_ok=True)
-    r = redis.Redis.from_url(args.redis_url, decode_responses=True)
+    # 每个进程的处理线程数上限：max_conns 个下载 + 同等数量的探活/425 等短请求
+    max_workers = args.max_conns * 2
+    # 每个处理线程最多占一条 Redis 连接，再加上心跳线程
+    r = connect_redis(args.redis_url, max_connections=max_workers + 1)
 
     host_ip = get_ip()
     pod_id = f"{host_ip}:{args.port}"
@@ -241,6 +587,13 @@ def main():
     }
     register_redis(r, pod_id, info)
 
+    handler = CacheRequestHandler.bind(os.path.abspath(args.cache_dir), args.origin, r, pod_id)
+    # 额外的服务进程必须在启动心跳线程、安装信号处理之前 fork；daemon 进程随主进程退出
+    if args.procs > 1:
+        ctx = multiprocessing.get_context("fork")
+        for _ in range(args.procs - 1):
+            ctx.Process(target=serve_forever, args=(args.port, handler, max_workers), daemon=True).start()
+
     stop_evt = threading.Event()
     t = threading.Thread(target=heartbeat_loop, args=(r, pod_id, info, stop_evt), daemon=True)
     t.start()
@@ -254,9 +607,9 @@ def main():
     signal.signal(signal.SIGTERM, _cleanup)
     atexit.register(unregister, r, pod_id)
 
-    handler = functools.partial(CacheRequestHandler, cache_dir=args.cache_dir, origin=args.origin, redis_cli=r, pod_id=pod_id)
-    with socketserver.ThreadingTCPServer(("0.0.0.0", args.port), handler) as httpd:
-        print(f"[pod] {pod_id} serving cache at {args.cache_dir}, origin={args.origin}, max_conns={args.max_conns}")
+    with CacheHTTPServer(("0.0.0.0", args.port), handler, max_workers,
+                         reuse_port=args.procs > 1) as httpd:
+        print(f"[pod] {pod_id} serving cache at {args.cache_dir}, origin={args.origin}, max_conns={args.max_conns}, procs={args.procs}")
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
@@ -0,0 +1,24 @@
+# redis_conn.py
+# 作用：Pod 与 Worker 共用的 Redis 连接池工厂，保证两边的连接池参数一致。
+
+import socket
+
+import redis  # pip install "redis[hiredis]"
+
+
+def connect_redis(url, max_connections=4):
+    """
+    进程级 Redis 连接池：复用连接并开启 TCP keepalive 与空闲健康检查。
+    装了 hiredis 时 redis-py 会自动改用其 C 解析器，解析 Lua 返回的数组更快。
+    fork 出的子进程首次使用时 redis-py 会按 pid 重建连接，不会共享父进程的 socket。
+    """
+    keepalive_opts = {socket.TCP_KEEPIDLE: 30} if hasattr(socket, "TCP_KEEPIDLE") else {}
+    pool = redis.ConnectionPool.from_url(
+        url,
+        decode_responses=True,
+        max_connections=max_connections,
+        socket_keepalive=True,
+        socket_keepalive_options=keepalive_opts,
+        health_check_interval=15,
+    )
+    return redis.Redis(connection_pool=pool)
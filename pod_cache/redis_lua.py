@@ -1,14 +1,26 @@
 # redis_lua.py
 # 用 Redis 的 SET 结构实现“并发占位”：
-# - 预定：SCARD < limit 才允许 SADD 一个唯一 token，并给 SET 设置 TTL（防泄漏）
+# - 预定：先确认 Pod 心跳仍新鲜，再在 SCARD < limit 时 SADD 一个唯一 token，并给 SET 设置 TTL（防泄漏）
 # - 释放：SREM token
 #
 # KEYS[1] = busy_set_key     (例如 "pod:172.18.153.153:9001:busy")
+# KEYS[2] = pods_zset        ("pods:active")
+# KEYS[3] = pod_hash_key     (例如 "pod:172.18.153.153:9001")
 # ARGV[1] = limit            (每个 pod 的并发上限，来自 pod.max_conns)
 # ARGV[2] = token            (唯一标识本次占位，例如 "<hostname>:<uuid>")
 # ARGV[3] = ttl_seconds      (保护超时清理的 TTL，避免程序异常导致占位泄漏)
+# ARGV[4] = min_score        (now - FRESH_SEC，心跳早于此视为失联)
+# ARGV[5] = pod_id           (pods_zset 中的 member)
+#
+# 返回 1 = 占位成功；0 = 已满；-1 = 心跳过期，已原子地摘除该 Pod（替代 Worker 侧的 HEAD 探活）
 
 RESERVE_LUA = """
+local score = redis.call('ZSCORE', KEYS[2], ARGV[5])
+if not score or tonumber(score) < tonumber(ARGV[4]) then
+  redis.call('ZREM', KEYS[2], ARGV[5])
+  redis.call('DEL', KEYS[3])
+  return -1
+end
 local n = redis.call('SCARD', KEYS[1])
 if n < tonumber(ARGV[1]) then
   redis.call('SADD', KEYS[1], ARGV[2])
@@ -25,4 +37,41 @@ end
 RELEASE_LUA = """
 redis.call('SREM', KEYS[1], ARGV[1])
 return redis.call('SCARD', KEYS[1])
-"""
\ No newline at end of file
+"""
+
+# 发现活跃 Pod：一次往返完成 ZRANGEBYSCORE + 逐个 HGETALL
+# KEYS[1] = pods_zset        ("pods:active")
+# ARGV[1] = min_score        (now - FRESH_SEC，只取最近有心跳的 Pod)
+# 返回扁平数组 {pod_id1, {k1, v1, ...}, pod_id2, {...}, ...}
+# HASH 已丢失的 member 视为僵尸节点，直接从 ZSET 清理，不返回
+DISCOVER_LUA = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], ARGV[1], '+inf')
+local out = {}
+for _, id in ipairs(ids) do
+  local h = redis.call('HGETALL', 'pod:' .. id)
+  if #h == 0 then
+    redis.call('ZREM', KEYS[1], id)
+  else
+    out[#out + 1] = id
+    out[#out + 1] = h
+  end
+end
+return out
+"""
+
+
+# 固定 K 副本预热：一次往返内原子完成“检查数量 -> 写入前 K 个 Pod -> 设置 TTL”
+# Lua 脚本执行期间不会有其他命令插入，无需再用 SETNX 锁防止并发挑选
+# KEYS[1] = preheat_set_key  (例如 "preheat:<file_md5>")
+# ARGV[1] = k                (预热副本数)
+# ARGV[2] = ttl_seconds      (预热授权过期时间)
+# ARGV[3..] = pod_ids        (一致性哈希排序后的前 K 个 Pod)
+# 返回 1 = 本次写入；0 = 集合已满足 K 个，未改动
+PREHEAT_LUA = """
+if redis.call('SCARD', KEYS[1]) >= tonumber(ARGV[1]) or #ARGV < 3 then
+  return 0
+end
+redis.call('SADD', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+return 1
+"""
@@ -2,26 +2,25 @@
 # 作用：Worker 负责下载一个逻辑路径（例如 big.pkg）
 # 策略：
 # 1) 发现“新鲜”Pod（最近心跳） -> 逐个尝试
-# 2) 对每个 Pod 先做健康检查（/healthz HEAD）
+# 2) 健康判定交给心跳：占位脚本里校验心跳新鲜度，过期的 Pod 原子摘除，不再 HEAD 探活
 # 3) 通过 Lua 原子占位（并发上限）成功后才发起下载：GET http://<pod>/files/<path>
 # 4) 任一 Pod 成功即返回；如果全部失败或超限，则回退到 origin（直连）
-# 5) 下载完成后做 MD5 校验：若 Redis 已有 md5:<path> 则比对；否则写入
+# 5) 下载完成后做 MD5 校验：SET NX 写入 md5:<path>，已有记录时再比对
 #
-# 依赖：pip install redis
+# 依赖：pip install "redis[hiredis]" urllib3
 # 需要与你的 pod.py / origin_server.py 一起使用。
 
 import argparse
+import functools
 import hashlib
 import os
-import random
 import sys
 import time
 import uuid
 import socket
-from urllib.request import Request, urlopen
-from urllib.error import HTTPError
-import redis
-from redis_lua import RELEASE_LUA, RESERVE_LUA
+import urllib3
+from redis_conn import connect_redis
+from redis_lua import DISCOVER_LUA, PREHEAT_LUA, RELEASE_LUA, RESERVE_LUA
 
 # Redis key 约定（与 pod.py 对齐）
 PODS_ZSET = "pods:active"
@@ -33,184 +32,186 @@ MD5_KEY_TMPL = "md5:{path}"
 PREHEAT_K = 2
 PREHEAT_TTL_SEC = 300
 PREHEAT_SET_TMPL = "preheat:{file_md5}"
-PREHEAT_LOCK_TMPL = "preheat:{file_md5}:lock"
 
 # “新鲜”心跳阈值（秒内有心跳才算活）
 FRESH_SEC = 15
 # 并发占位的保护 TTL（秒），防止程序异常导致占位泄漏
 RESERVE_TTL_SEC = 60
 
-def http_head(url, timeout=2):
-    """发送 HEAD 请求，返回 True/False"""
-    try:
-        req = Request(url, method="HEAD")
-        with urlopen(req, timeout=timeout) as resp:
-            return resp.status == 200
-    except Exception:
-        return False
-    
+# 建连超时（秒）：Worker 不再 HEAD 探活，失联但心跳未过期的 Pod 靠它快速跳过
+CONNECT_TIMEOUT_SEC = 2
 
-def http_get(url, dest_path, timeout=60):
-    """用标准库下载到文件（流式），成功 True；失败 False 并删除半拉子文件"""
+# 进程级 HTTP 连接池：下载复用 keep-alive 连接，避免每次请求都重新握手
+_HTTP = urllib3.PoolManager(num_pools=32, maxsize=8, retries=False)
+
+def http_get(url, dest_path, timeout=60, hasher=None):
+    """
+    用连接池下载到文件（流式），返回 (ok, err, hexdigest)；失败时删除半拉子文件。
+    传入 hasher 时边下载边计算摘要，省去写完后再把文件读一遍。
+    """
+    try:
+        resp = _HTTP.request("GET", url, preload_content=False,
+                             timeout=urllib3.Timeout(connect=CONNECT_TIMEOUT_SEC, read=timeout))
+    except Exception as e:
+        return False, str(e), None
     try:
-        with urlopen(url, timeout=timeout) as resp, open(dest_path, "wb") as out:
-            while True:
-                chunk = resp.read(1024 * 1024)
-                if not chunk:
-                    break
+        if resp.status != 200:
+            # 接下来会转去其他 Pod 或回源，不保留这条连接，以免它在 Pod 端空占一个工作线程
+            resp.close()
+            # 透传 425 用于上层判断切换 Pod
+            if resp.status == 425:
+                return False, "425-preheat-required", None
+            return False, f"HTTPError:{resp.status}", None
+        with open(dest_path, "wb") as out:
+            for chunk in resp.stream(1024 * 1024):
+                if hasher is not None:
+                    hasher.update(chunk)
                 out.write(chunk)
-        return True, None
-    except HTTPError as e:
-        # 透传 425 用于上层判断切换 Pod
-        if e.code == 425:
-            return False, "425-preheat-required"
-        try:
-            if os.path.exists(dest_path):
-                os.remove(dest_path)
-        except Exception:
-            pass
-        return False, f"HTTPError:{e.code}"
+        return True, None, hasher.hexdigest() if hasher is not None else None
     except Exception as e:
+        # 中途失败（写盘出错、读超时等）：直接断开连接，不再把剩余 body 读完
+        resp.close()
         try:
             if os.path.exists(dest_path):
                 os.remove(dest_path)
         except Exception:
             pass
-        return False, str(e)
+        return False, str(e), None
+    finally:
+        resp.release_conn()
     
 
-def compute_md5(path):
-    """计算文件 MD5（十六进制字符串）"""
-    h = hashlib.md5()
-    with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(1024 * 1024), b""):
-            h.update(chunk)
-    return h.hexdigest()
-
-
 def fetch_md5(r, logical_path):
     return r.get(MD5_KEY_TMPL.format(path=logical_path))
 
 
 def set_md5(r, logical_path, md5_hex):
-    r.set(MD5_KEY_TMPL.format(path=logical_path), md5_hex)
-
-
-def get_fresh_pods(r):
-    """读取 pods:active（ZSET），筛选最近 FRESH_SEC 秒内的活跃 pod 列表，打乱顺序"""
-    now = time.time()
-    pods = []
-    for member, score in r.zrange(PODS_ZSET, 0, -1, withscores=True):
-        if score >= now - FRESH_SEC:
-            pods.append(member)
-    random.shuffle(pods)
+    """仅在尚无记录时写入（SET NX），一次往返；返回 True 表示本次写入了首个 MD5"""
+    return bool(r.set(MD5_KEY_TMPL.format(path=logical_path), md5_hex, nx=True))
+
+
+def load_scripts(r):
+    """Worker 启动时一次性加载所有 Lua 脚本，返回 name -> sha"""
+    return {
+        "reserve": r.script_load(RESERVE_LUA),
+        "release": r.script_load(RELEASE_LUA),
+        "discover": r.script_load(DISCOVER_LUA),
+        "preheat": r.script_load(PREHEAT_LUA),
+    }
+
+
+def discover_pods(r, discover_sha):
+    """一次 EVALSHA 取回最近 FRESH_SEC 秒内有心跳的 pod 及其元信息，返回 {pod_id: info}"""
+    flat = r.evalsha(discover_sha, 1, PODS_ZSET, str(time.time() - FRESH_SEC))
+    pods = {}
+    for i in range(0, len(flat), 2):
+        fields = flat[i + 1]
+        pods[flat[i]] = dict(zip(fields[::2], fields[1::2]))
     return pods
 
+@functools.lru_cache(maxsize=4096)
+def file_key(logical_path: str) -> str:
+    """逻辑路径 -> 预热集合使用的文件 key（与 pod.py 的 _file_md5 一致）"""
+    return hashlib.md5(logical_path.encode("utf-8"), usedforsecurity=False).hexdigest()
+
 def ring_order_pods(logical_path: str, pods: list[str]) -> list[str]:
     """对 pods 按 (logical_path|pod_id) 的 md5 进行稳定排序（轻量一致性哈希）。"""
     def score(p):
-        return hashlib.md5(f"{logical_path}|{p}".encode("utf-8")).hexdigest()
+        # 取 digest 前 8 字节转成整数比较，免去 hexdigest 格式化和 32 字符字符串比较
+        digest = hashlib.md5(f"{logical_path}|{p}".encode("utf-8"), usedforsecurity=False).digest()
+        return int.from_bytes(digest[:8], "big")
     return sorted(pods, key=score)
 
-def ensure_preheat_set(r, logical_path: str, ordered_pods: list[str]):
-    """固定 K 个预热副本：加锁后将前 K 个 Pod 写入 preheat set（带 TTL）。"""
-    file_md5 = hashlib.md5(logical_path.encode("utf-8")).hexdigest()
-    set_key = PREHEAT_SET_TMPL.format(file_md5=file_md5)
-    local_key = PREHEAT_LOCK_TMPL.format(file_md5=file_md5)
-    # 若已有集合且数量>=K，则直接返回
-    try:
-        n = r.scard(set_key)
-        if n >= PREHEAT_K:
-            return
-    except Exception:
-        pass
-    
-    # 分布式互斥，避免并发挑选
-    if r.set(local_key, "1", nx=True, ex=10):
-        try:
-            # 避免重复写
-            n2 = r.scard(set_key)
-            if n2 is None or n2 < PREHEAT_K:
-                targets = ordered_pods[:PREHEAT_K]
-                if targets:
-                    r.sadd(set_key, *targets)
-                    r.expire(set_key, PREHEAT_TTL_SEC)
-        finally:
-            r.delete(local_key)
+def ensure_preheat_set(r, preheat_sha, logical_path: str, ordered_pods: list[str]):
+    """固定 K 个预热副本：一次 EVALSHA 原子地将前 K 个 Pod 写入 preheat set（带 TTL）。"""
+    set_key = PREHEAT_SET_TMPL.format(file_md5=file_key(logical_path))
+    targets = ordered_pods[:PREHEAT_K]
+    r.evalsha(preheat_sha, 1, set_key, str(PREHEAT_K), str(PREHEAT_TTL_SEC), *targets)
     return set_key
 
 
-
-def try_download_via_pods(r, logical_path, dest_path):
-    """按“健康 -> 占位 -> 下载”的流程尝试所有“新鲜 pod”"""
-    pods = get_fresh_pods(r)
-    if not pods:
+def try_download_via_pods(r, shas, logical_path, dest_path):
+    """按“心跳校验 + 占位 -> 下载”的流程尝试所有“新鲜 pod”"""
+    pod_infos = discover_pods(r, shas["discover"])
+    if not pod_infos:
         print("[worker] no fresh pods available")
-        return False, "no pods"
+        return False, "no pods", None
     
     # 一致性哈希
-    pods = ring_order_pods(logical_path, pods)
-
-    # 预加载 Lua 脚本
-    reserve_sha = r.script_load(RESERVE_LUA)
-    release_sha = r.script_load(RELEASE_LUA)
+    pods = ring_order_pods(logical_path, list(pod_infos))
 
     # 固定 K 个预热副本
-    ensure_preheat_set(r, logical_path, pods)
+    ensure_preheat_set(r, shas["preheat"], logical_path, pods)
 
     hostname = socket.gethostname()
 
-    for pod_id in pods:
-        h = r.hgetall(POD_HASH_TMPL.format(id=pod_id))
-        if not h:
-            # ZSET 里挂了旧 member，清理一下
-            r.zrem(PODS_ZSET, pod_id)
-            continue        
-        
+    def reserve_call(pod_id):
+        """生成一次占位 EVALSHA 的参数，返回 (token, evalsha_args)"""
+        max_conns = int(pod_infos[pod_id].get("max_conns", 1))
+        token = f"{hostname}:{uuid.uuid4()}"
+        keys = (BUSY_SET_TMPL.format(id=pod_id), PODS_ZSET, POD_HASH_TMPL.format(id=pod_id))
+        min_score = str(time.time() - FRESH_SEC)
+        return token, (shas["reserve"], len(keys), *keys,
+                       str(max_conns), token, str(RESERVE_TTL_SEC), min_score, pod_id)
+
+    # 上一个 Pod 下载失败时，释放与下一个 Pod 的占位合并在同一条流水线里，这里存放其结果
+    pending = None
+
+    for i, pod_id in enumerate(pods):
+        h = pod_infos[pod_id]
         host = h.get("host")
         port = h.get("port")
-        max_conns = int(h.get("max_conns", 1))
-
-        # 健康检查
-        health_url = f"http://{host}:{port}/healthz"
-        if not http_head(health_url):
-            print(f"[worker] pod {pod_id} unhealthy; removing")
-            r.zrem(PODS_ZSET, pod_id)
-            r.delete(POD_HASH_TMPL.format(id=pod_id))
-            continue
 
-        # 并发占位
+        # 并发占位（Lua 内同时校验心跳新鲜度，不再单独 HEAD 探活）
         busy_key = BUSY_SET_TMPL.format(id=pod_id)
-        token = f"{hostname}:{uuid.uuid4()}"
-        ok = r.evalsha(reserve_sha, 1, busy_key, str(max_conns), token, str(RESERVE_TTL_SEC))
+        if pending is None:
+            token, call = reserve_call(pod_id)
+            ok = r.evalsha(*call)
+        else:
+            token, ok = pending
+            pending = None
+        if ok == -1:
+            print(f"[worker] pod {pod_id} heartbeat stale; removed")
+            continue
         if ok != 1:
             print(f"[worker] pod {pod_id} at capacity")
             continue
         
+        released = False
         try:
             # 真正下载
             url = f"http://{host}:{port}/files/{logical_path}"
             print(f"[worker] downloading via pod {pod_id} -> {url}")
-            success, err = http_get(url, dest_path)
+            success, err, md5_hex = http_get(url, dest_path, hasher=hashlib.md5(usedforsecurity=False))
             if success:
-                return True, None
+                return True, None, md5_hex
             else:
                 if err == "425-preheat-required":
                     print(f"[worker] pod {pod_id} not authorized to preheat; try next")
                 else:
                     print(f"[worker] error via pod {pod_id}: {err}")
+            if i + 1 < len(pods):
+                # 释放当前占位 + 预定下一个 Pod，一次往返
+                next_token, next_call = reserve_call(pods[i + 1])
+                pipe = r.pipeline(transaction=False)
+                pipe.evalsha(shas["release"], 1, busy_key, token)
+                pipe.evalsha(*next_call)
+                _, next_ok = pipe.execute()
+                released = True
+                pending = (next_token, next_ok)
         finally:
             # 释放占位
-            r.evalsha(release_sha, 1, busy_key, token)
+            if not released:
+                r.evalsha(shas["release"], 1, busy_key, token)
 
-    return False, "all pods failed or busy"
+    return False, "all pods failed or busy", None
 
 
 def download_fallback(origin, logical_path, dest_path):
     """全部 pod 失败/繁忙时，直连源站"""
     url = f"{origin.rstrip('/')}/{logical_path}"
     print(f"[worker] fallback to origin {url}")
-    return http_get(url, dest_path)
+    return http_get(url, dest_path, hasher=hashlib.md5(usedforsecurity=False))
 
 
 def main():
@@ -224,29 +225,35 @@ def main():
     os.makedirs(args.dest, exist_ok=True)
     out_path = os.path.join(args.dest, os.path.basename(args.path))
 
-    r = redis.Redis.from_url(args.redis_url, decode_responses=True)
+    r = connect_redis(args.redis_url)
+    shas = load_scripts(r)
 
     # 1) 优先通过 Pod 下载
-    ok, err = try_download_via_pods(r, args.path, out_path)
+    ok, err, got_md5 = try_download_via_pods(r, shas, args.path, out_path)
     if not ok:
         # 2) 失败则回退源站
-        ok2, err2 = download_fallback(args.origin, args.path, out_path)
+        ok2, err2, got_md5 = download_fallback(args.origin, args.path, out_path)
         if not ok2:
             print(f"[worker] failed: {err} / {err2}")
             sys.exit(2)
 
-    # 3) MD5 校验（首次下载写入，后续对比）
-    known_md5 = fetch_md5(r, args.path)
-    got_md5 = compute_md5(out_path)
-    if known_md5:
+    # 3) MD5 校验（首次下载写入，后续对比）；got_md5 已在下载过程中算好
+    # SET NX 失败后记录可能在 GET 之前被删除或过期，此时重新尝试写入，而不是当作校验通过
+    for _ in range(2):
+        if set_md5(r, args.path, got_md5):
+            print(f"[worker] MD5 set: {got_md5}")
+            break
+        # 已有记录时才需要再读一次做比对
+        known_md5 = fetch_md5(r, args.path)
+        if known_md5 is None:
+            continue
         if known_md5 != got_md5:
             print(f"[worker] MD5 mismatch! expected={known_md5}, got={got_md5}")
             sys.exit(3)
-        else:
-            print(f"[worker] MD5 OK: {got_md5}")
+        print(f"[worker] MD5 OK: {got_md5}")
+        break
     else:
-        set_md5(r, args.path, got_md5)
-        print(f"[worker] MD5 set: {got_md5}")
+        print(f"[worker] WARNING: MD5 record kept disappearing, not verified: {got_md5}")
 
     print(f"[worker] done: {out_path}")
 